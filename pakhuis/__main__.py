@@ -3,6 +3,7 @@
 A json document storage service with limited search capability.
 """
 
+import os
 import sys
 from dataclasses import dataclass, field
 from pathlib import Path
@@ -10,8 +11,10 @@ from typing import Annotated, Optional
 
 import typer
 import uvicorn
+from starlette.applications import Starlette
 
 from . import __author__, __date__, __version__, make_app
+from .database import PakhuisDatabase
 from .log import logger, LogLevels, init_logger
 from .tomlconfig import ConfigReader
 
@@ -25,6 +28,8 @@ class PakhuisConfig:
     """Pakhuis config."""
 
     database: Path = Path("pakhuis.db")
+    cache_size: int = -65536
+    mmap_size: int = 268435456
 
 
 @dataclass
@@ -35,6 +40,7 @@ class ServerConfig:
     port: int = 80
     ssl_key: Path | None = None
     ssl_cert: Path | None = None
+    workers: int = 1
 
 
 @dataclass
@@ -51,6 +57,30 @@ class MainConfig:
 #####
 
 
+def config_app(config: MainConfig, instance: Path, *, debug: bool) -> Starlette:
+    """Create the app from the config."""
+    return make_app(
+        instance / config.pakhuis.database,
+        debug=debug,
+        cache_size=config.pakhuis.cache_size,
+        mmap_size=config.pakhuis.mmap_size,
+    )
+
+
+def worker_app() -> Starlette:
+    """Create the app in a worker process.
+
+    Worker processes start without the state of the main process, which
+    passes the command line options through environment variables.
+    """
+    cfg = Path(os.environ["PAKHUIS_CFG"])
+    debug = init_logger(
+        LogLevels(os.environ["PAKHUIS_LOGLEVEL"]), Path(os.environ["PAKHUIS_LOG_DIR"])
+    )
+    config = ConfigReader.from_file(MainConfig, cfg)
+    return config_app(config, cfg.parent, debug=debug)
+
+
 def main(
     *,
     cfg: Annotated[Path, typer.Option(help="Configuration file.")] = Path(
@@ -81,7 +111,17 @@ def main(
 
         config = ConfigReader.from_file(MainConfig, cfg)
 
-        app = make_app(instance / config.pakhuis.database, debug=debug)
+        # multiple worker processes need the app as an import string
+        workers = 1 if debug else config.server.workers
+        if workers > 1:
+            # create or upgrade the database before the workers start
+            PakhuisDatabase(instance / config.pakhuis.database).close()
+            os.environ["PAKHUIS_CFG"] = str(cfg.resolve())
+            os.environ["PAKHUIS_LOG_DIR"] = str(log_dir.resolve())
+            os.environ["PAKHUIS_LOGLEVEL"] = loglevel.value
+            app = f"{__package__}.__main__:worker_app"
+        else:
+            app = config_app(config, instance, debug=debug)
 
         if config.server.ssl_key and config.server.ssl_cert:
             ssl_key = instance / config.server.ssl_key
@@ -92,21 +132,32 @@ def main(
             ssl_cert = None
             ssl = False
         logger.success(
-            "Serving on {}://{}:{}",
+            "Serving on {}://{}:{} ({} worker(s))",
             "https" if ssl else "http",
             config.server.host,
             config.server.port,
+            workers,
         )
 
         try:
             uvicorn.run(
                 app,
+                factory=workers > 1,
+                workers=workers,
                 host=config.server.host,
                 port=config.server.port,
                 log_config={"version": 1, "disable_existing_loggers": False},
-                log_level="debug",  # log everything, let loguru handle the filtering
+                # in debug mode, log everything and let loguru handle the filtering
+                log_level="debug" if debug else "warning",
+                access_log=debug,
+                # client address and server header are not used
+                proxy_headers=False,
+                server_header=False,
                 ssl_keyfile=ssl_key,
                 ssl_certfile=ssl_cert,
+                # uvloop is not available on windows
+                loop="asyncio" if sys.platform == "win32" else "uvloop",
+                http="httptools",
             )
         except KeyboardInterrupt:
             pass
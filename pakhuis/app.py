@@ -0,0 +1,60 @@
+"""Pakhuis Starlette app."""
+
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any
+
+from starlette.applications import Starlette
+from starlette import status
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.requests import Request
+
+from .responses import ORJSONResponse
+from .webservice import PakhuisService
+
+
+async def json_error(request: Request, exc: HTTPException):
+    """Error handler to show json instead of text."""
+    status_code = getattr(exc, "status_code", status.HTTP_500_INTERNAL_SERVER_ERROR)
+    detail = getattr(exc, "detail", None)
+    if detail is None:
+        detail = str(exc)
+    return ORJSONResponse(
+        {"code": status_code, "detail": detail},
+        status_code=status_code,
+        headers=getattr(exc, "headers", None),
+    )
+
+
+def make_app(
+    database_path: str | Path = "pakhuis.db",
+    *,
+    debug: bool = False,
+    **db_options: Any,
+) -> Starlette:
+    """Create the Starlette app.
+
+    db_options: passed on to the database (see PakhuisDatabase)
+    """
+    # webservice
+    ws = PakhuisService(database_path, **db_options)
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        """Close the database connection on shutdown."""
+        yield
+        ws.db.close()
+
+    ### Server
+    app = Starlette(
+        debug=debug,
+        routes=ws.routes,
+        exception_handlers={404: json_error, 500: json_error},
+        lifespan=lifespan,
+        # json lists compress well; a medium level is a lot faster than the default 9
+        middleware=[Middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)],
+    )
+    return app
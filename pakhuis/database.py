@@ -3,36 +3,75 @@
 # ruff: noqa: E501, RUF012, PLE1205
 
 import datetime
-import json
+import os
 import sqlite3
-from collections.abc import Generator
+import threading
+from collections.abc import Generator, Iterable, Mapping, Sequence
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Any
 
-from jsonpointer import resolve_pointer
+import orjson
+from jsonpointer import JsonPointer
 
 from .log import logger
 
-
 # sqlite3 datetime conversion
+# stored as integer microseconds since the epoch (UTC), naive datetimes are UTC
 # see https://docs.python.org/3/library/sqlite3.html#adapter-and-converter-recipes
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def adapt_datetime_epoch(val: datetime.datetime) -> int:
+    """Adapt datetime.datetime to microseconds since the epoch."""
+    if val.tzinfo is None:
+        val = val.replace(tzinfo=datetime.UTC)
+    return (val - EPOCH) // MICROSECOND
+
+
+sqlite3.register_adapter(datetime.datetime, adapt_datetime_epoch)
+
+
+def format_dttm(val: int) -> str:
+    """Format microseconds since the epoch as ISO 8601 date/time (UTC)."""
+    return (EPOCH + val * MICROSECOND).isoformat(" ")
 
-def adapt_datetime_iso(val: datetime.datetime) -> str:
-    """Adapt datetime.datetime to ISO format."""
-    return val.isoformat(" ", timespec="seconds")
 
+def dumps(val: Any) -> str:
+    """Serialize to compact json text, as stored in the database."""
+    return orjson.dumps(val).decode()
 
-sqlite3.register_adapter(datetime.datetime, adapt_datetime_iso)
 
+def is_number(val: Any) -> bool:
+    """Json number (bool is an int in python, but not in json)."""
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
 
-def convert_datetime(val: bytes) -> datetime.datetime:
-    """Convert ISO 8601 datetime to datetime.datetime object."""
-    return datetime.datetime.fromisoformat(val.decode())
 
+def index_value(val: Any) -> tuple[str, str | None, int | float | None]:
+    """Index value as json text, the text itself for strings (glob/like)
+    and the number itself for numbers (range comparisons)."""
+    return (
+        dumps(val),
+        val if isinstance(val, str) else None,
+        val if is_number(val) else None,
+    )
 
-sqlite3.register_converter("datetime", convert_datetime)
+
+def json_path(pointer: str) -> str | None:
+    """Convert a json pointer into an sqlite json path.
+
+    None if the pointer has a numeric token: that is a list position or an
+    object key depending on the document, which an sqlite path can't express.
+    """
+    path = "$"
+    for token in pointer.split("/")[1:]:
+        token = token.replace("~1", "/").replace("~0", "~")  # noqa: PLW2901
+        if token.isdigit():
+            return None
+        path += f'."{token}"'
+    return path
 
 
 class NOTFOUND:
@@ -42,8 +81,9 @@ class NOTFOUND:
 class SearchWhere:
     """Build sql criteria from a search dict."""
 
-    def __init__(self) -> None:
+    def __init__(self, _bin: str) -> None:
         """Build sql criteria from a search dict."""
+        self.bin = _bin
         self.base_ops = {
             "and": "and",
             "or": "or",
@@ -51,11 +91,23 @@ class SearchWhere:
         self.ops: dict[str, str] = {}
 
         # this comes by a lot
+        # not correlated: sqlite looks up the matching ids once, using the index
         self._base_crit = (
-            "select 1 from SEARCH_VALUES where BIN = P.BIN and ID = P.ID and KEY = ?"
+            "P.ID in (select ID from SEARCH_VALUES where BIN = ? and KEY = ?"
         )
 
-    def set_keys(self, keys: list[dict[str, str]]) -> None:
+    def criterion(self, key: str, cond: str, value: Any) -> tuple[str, list]:
+        """Criterion on the index values of a key."""
+        return f"{self._base_crit} and {cond})", [self.bin, key, value]
+
+    def compare(self, key: str, op: str, value: Any) -> tuple[str, list]:
+        """Criterion comparing the index values of a key."""
+        # json text sorts numbers as text ("9" > "10"), compare numbers as numbers
+        if is_number(value):
+            return self.criterion(key, f"NUM_VALUE {op} ?", value)
+        return self.criterion(key, f"VALUE {op} ?", dumps(value))
+
+    def set_keys(self, keys: list[dict[str, Any]]) -> None:
         """Set the search keys."""
         ops = {k["key"]: k["type"] for k in keys}
         ops.update(self.base_ops)
@@ -89,23 +141,23 @@ class SearchWhere:
 
     def op_eq(self, key: str, value: Any) -> tuple[str, list]:
         """Operator: eq (equal to)."""
-        return (f"exists({self._base_crit} and ? = VALUE))", [key, json.dumps(value)])
+        return self.criterion(key, "VALUE = ?", dumps(value))
 
     def op_lt(self, key: str, value: Any) -> tuple[str, list]:
         """Operator: lt (less than)."""
-        return (f"exists({self._base_crit} and ? < VALUE))", [key, json.dumps(value)])
+        return self.compare(key, "<", value)
 
     def op_lte(self, key: str, value: Any) -> tuple[str, list]:
         """Operator: lte (less than or equal to)."""
-        return (f"exists({self._base_crit} and ? <= VALUE))", [key, json.dumps(value)])
+        return self.compare(key, "<=", value)
 
     def op_gt(self, key: str, value: Any) -> tuple[str, list]:
         """Operator: gt (greater than)."""
-        return (f"exists({self._base_crit} and ? > VALUE))", [key, json.dumps(value)])
+        return self.compare(key, ">", value)
 
     def op_gte(self, key: str, value: Any) -> tuple[str, list]:
         """Operator: gte (greater than or equal to)."""
-        return (f"exists({self._base_crit} and ? >= VALUE))", [key, json.dumps(value)])
+        return self.compare(key, ">=", value)
 
     def op_in_list(self, key: str, value: Any) -> tuple[str, list]:
         """Operator: in_list (value occurs in json list)."""
@@ -115,25 +167,19 @@ class SearchWhere:
 
     def op_glob(self, key: str, value: str) -> tuple[str, list]:
         """Operator: glob (text search by glob)."""
-        # text search on value: assume string and remove leading and trailing quotes
-        return (
-            f"""exists({self._base_crit} and trim(VALUE, '"') glob ?)""",
-            [key, value],
-        )
+        # text search on string values
+        return self.criterion(key, "TEXT_VALUE glob ?", value)
 
     def op_like(self, key: str, value: str) -> tuple[str, list]:
         """Operator: like (text search by sql like)."""
-        # text search on value: assume string and remove leading and trailing quotes
-        return (
-            f"""exists({self._base_crit} and trim(VALUE, '"') like ?)""",
-            [key, value],
-        )
+        # text search on string values
+        return self.criterion(key, "TEXT_VALUE like ?", value)
 
 
 class PakhuisDatabase:
     """Pakhuis database."""
 
-    _version = (1, 2)
+    _version = (1, 11)
 
     # config for a bin: key in dict: (key in db, default value)
     _bin_cfg_keys = {
@@ -142,33 +188,61 @@ class PakhuisDatabase:
 
     # sql queries
     _queries = {
-        "get_bins": """select distinct P.BIN from PAKHUIS P where P.DTTM = (select max(DTTM) from PAKHUIS where BIN = P.BIN and ID = P.ID) and P.STATUS = 'A' order by 1""",
-        "get_bin_item_ids": """select P.ID from PAKHUIS P where P.BIN = ? and P.DTTM = (select max(DTTM) from PAKHUIS where BIN = P.BIN and ID = P.ID) and P.STATUS = 'A' order by 1""",
-        "get_bin_items": """select P.ID, P.CONTENT from PAKHUIS P where P.BIN = ? and P.DTTM = (select max(DTTM) from PAKHUIS where BIN = P.BIN and ID = P.ID) and P.STATUS = 'A' order by 1""",
+        "get_cache_version": """pragma user_version""",
+        "get_bins": """select distinct P.BIN from PAKHUIS P where P.IS_CURRENT = 1 and P.STATUS = 'A' order by 1""",
+        "get_bin_item_ids": """select P.ID from PAKHUIS P where P.BIN = ? and P.IS_CURRENT = 1 and P.STATUS = 'A' order by 1""",
+        "get_bin_items": """select P.ID, P.CONTENT from PAKHUIS P where P.BIN = ? and P.IS_CURRENT = 1 and P.STATUS = 'A' order by 1""",
         "set_bin_config": """insert or replace into BIN_CONFIG (BIN, INCLUDE_ID) values (?, ?)""",
-        "get_bin_config": """select INCLUDE_ID from BIN_CONFIG where BIN = ?""",
-        "set_item": """insert into PAKHUIS (BIN, ID, DTTM, CONTENT) values (?, ?, ?, ?)""",
-        "get_item": """select P.CONTENT from PAKHUIS P where P.BIN = ? and P.ID = ? and P.DTTM = (select max(DTTM) from PAKHUIS where BIN = P.BIN and ID = P.ID) and P.STATUS = 'A'""",
-        "get_item_history": """select P.DTTM, P.STATUS, P.CONTENT from PAKHUIS P where P.BIN = ? and P.ID = ? order by 1""",
-        "get_index_keys": """select KEY, PATH, TYPE from SEARCH_KEYS where BIN = ?""",
+        "get_bin_config": """select BIN, INCLUDE_ID from BIN_CONFIG""",
+        "set_item_old": """update PAKHUIS set IS_CURRENT = 0 where BIN = ? and ID = ? and IS_CURRENT = 1 and DTTM <= ?""",
+        "set_item": """insert into PAKHUIS (BIN, ID, DTTM, STATUS, CONTENT, IS_CURRENT) values (?1, ?2, ?3, ?4, ?5, not exists (select 1 from PAKHUIS where BIN = ?1 and ID = ?2 and IS_CURRENT = 1)) returning IS_CURRENT""",
+        "get_item": """select P.ID, P.CONTENT from PAKHUIS P where P.BIN = ? and P.ID = ? and P.IS_CURRENT = 1 and P.STATUS = 'A'""",
+        "get_item_history": """select P.ID, P.DTTM, P.STATUS, P.CONTENT from PAKHUIS P where P.BIN = ? and P.ID = ? order by P.DTTM""",
+        "get_index_keys": """select KEY, PATH, JSON_PATH, TYPE from SEARCH_KEYS where BIN = ?""",
         "set_index_item_del": """delete from SEARCH_VALUES where BIN = ? and ID = ?""",
-        "set_index_item_ins": """insert into SEARCH_VALUES (BIN, KEY, ID, VALUE) values (?, ?, ?, ?)""",
+        "set_index_item_ins": """insert into SEARCH_VALUES (BIN, KEY, ID, VALUE, TEXT_VALUE, NUM_VALUE) values (?, ?, ?, ?, ?, ?)""",
         "set_index_del": """delete from SEARCH_KEYS where BIN = ?""",
-        "set_index_ins": """insert into SEARCH_KEYS (BIN, KEY, PATH, TYPE) values (?, ?, ?, ?)""",
+        "set_index_ins": """insert into SEARCH_KEYS (BIN, KEY, PATH, JSON_PATH, TYPE) values (?, ?, ?, ?, ?)""",
         "get_index": """select KEY, PATH, TYPE from SEARCH_KEYS where BIN = ?""",
+        "refresh_index_del": """delete from SEARCH_VALUES where BIN = ?""",
+        "refresh_index_ins": """insert into SEARCH_VALUES (BIN, KEY, ID, VALUE, TEXT_VALUE, NUM_VALUE) select P.BIN, ?2, P.ID, coalesce(P.CONTENT -> ?3, 'null'), iif(json_type(P.CONTENT, ?3) = 'text', P.CONTENT ->> ?3, null), iif(json_type(P.CONTENT, ?3) in ('integer', 'real'), P.CONTENT ->> ?3, null) from PAKHUIS P where P.BIN = ?1 and P.IS_CURRENT = 1 and P.STATUS = 'A'""",
+        "refresh_index_ins_list": """insert into SEARCH_VALUES (BIN, KEY, ID, VALUE, TEXT_VALUE, NUM_VALUE) select P.BIN, ?2, P.ID, P.CONTENT -> J.FULLKEY, iif(J.TYPE = 'text', J.VALUE, null), iif(J.TYPE in ('integer', 'real'), J.VALUE, null) from PAKHUIS P, json_each(P.CONTENT, ?3) J where P.BIN = ?1 and P.IS_CURRENT = 1 and P.STATUS = 'A' and json_type(P.CONTENT, ?3) = 'array'""",
         "get_index_values": """select distinct VALUE from SEARCH_VALUES where BIN = ? and KEY = ? order by VALUE asc""",
-        "search_items": """select P.ID, P.CONTENT from PAKHUIS P where P.BIN = ? and P.DTTM = (select max(DTTM) from PAKHUIS where BIN = P.BIN and ID = P.ID) and P.STATUS = 'A' and 1=1 order by 1""",
-        "sync_list": """select P.BIN, P.ID, P.DTTM, P.STATUS from PAKHUIS P where 1=1 and P.DTTM = (select max(DTTM) from PAKHUIS where BIN = P.BIN and ID = P.ID) order by 1, 2""",
-        "cleanup": """delete from PAKHUIS where 1=1 and DTTM < ? and (STATUS = "I" or exists (select 1 from PAKHUIS P where P.BIN = PAKHUIS.BIN and P.ID = PAKHUIS.ID and P.DTTM > PAKHUIS.DTTM))""",
+        "search_items": """select P.ID, P.CONTENT from PAKHUIS P where P.BIN = ? and P.IS_CURRENT = 1 and P.STATUS = 'A' and 1=1 order by 1""",
+        "sync_list": """select P.BIN, P.ID, P.DTTM, P.STATUS from PAKHUIS P where 1=1 and P.IS_CURRENT = 1 order by 1, 2""",
+        "cleanup": """delete from PAKHUIS where 1=1 and DTTM < ? and (STATUS = 'I' or IS_CURRENT = 0)""",
+    }
+    # queries with content for bins that include the id in it (see bin config)
+    _queries_with_id = {
+        k: v.replace("P.CONTENT", "json_set(P.CONTENT, '$.id', P.ID) as CONTENT")
+        for k, v in _queries.items()
+        if k in ("get_bin_items", "get_item", "get_item_history", "search_items")
     }
 
     ### Init
-    def __init__(self, path: Path) -> None:
-        """Pakhuis database."""
+    def __init__(
+        self, path: str | Path, *, cache_size: int = -65536, mmap_size: int = 268435456
+    ) -> None:
+        """Pakhuis database.
+
+        cache_size: sqlite page cache (negative: in KiB)
+        mmap_size: maximum bytes of the database file to memory-map
+        """
         self._logger = logger.bind(logtype="pakhuis.database")
-        self.path = path
+        # sqlite3 wants a str, convert only once
+        self.path = os.fspath(path)
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.RLock()
+        self._depth = 0
         self.bin_cfg: dict[str, dict[str, Any]] = {}
-        self.search_where = SearchWhere()
+        self._bin_cfg_loaded = False
+        # index keys and search criteria builder per bin
+        # valid as long as the cache version (user_version) does not change
+        self._cache_version: int | None = None
+        self.index_keys: dict[str, list[dict[str, Any]]] = {}
+        self.search_where: dict[str, SearchWhere] = {}
 
         v = self.version()
         if v != self._version:
@@ -178,57 +252,177 @@ class PakhuisDatabase:
                 init_db(conn, v)
 
     ### Support methods
-    def _get_content(self, _bin: str, row: sqlite3.Row) -> Any:
-        """Extract json content from the database row."""
-        content = json.loads(row["content"])
+    def _get_content_query(self, _bin: str, name: str) -> str:
+        """Get a query that selects content, with the id added if configured."""
         if self.get_bin_config(_bin)["include_id"]:
-            content["id"] = row["id"]
-        return content
+            return self._queries_with_id[name]
+        return self._queries[name]
+
+    def _get_content(self, row: sqlite3.Row) -> Any:
+        """Extract json content from the database row."""
+        return orjson.loads(row["content"])
+
+    def _check_cache(self, conn: sqlite3.Connection) -> None:
+        """Forget cached bin config and index keys changed by another process."""
+        version = conn.execute(self._queries["get_cache_version"]).fetchone()[0]
+        if version != self._cache_version:
+            self._logger.debug("Cache version {}, forget cached bins", version)
+            self.bin_cfg.clear()
+            self._bin_cfg_loaded = False
+            self.index_keys.clear()
+            self.search_where.clear()
+            self._cache_version = version
+
+    def _cache_changed(self, conn: sqlite3.Connection) -> None:
+        """Make every process forget its cached bin config and index keys."""
+        # the user version in the database header is free for the application,
+        # set after the change itself, it is part of the same transaction
+        version = conn.execute(self._queries["get_cache_version"]).fetchone()[0]
+        conn.execute(f"pragma user_version = {version + 1:d}")
 
     def _get_index_keys(
         self, conn: sqlite3.Connection, _bin: str
-    ) -> list[dict[str, str]]:
+    ) -> list[dict[str, Any]]:
         """Get the index items for a bin."""
-        result = []
-        for row in conn.execute(self._queries["get_index_keys"], (_bin,)):
-            result.append({"key": row["key"], "path": row["path"], "type": row["type"]})
-        return result
+        self._check_cache(conn)
+        if _bin not in self.index_keys:
+            result = []
+            for row in conn.execute(self._queries["get_index_keys"], (_bin,)):
+                result.append(
+                    {
+                        "key": row["key"],
+                        "path": row["path"],
+                        "json_path": row["json_path"],
+                        "type": row["type"],
+                        # parsed once, used for every item that is stored
+                        "pointer": JsonPointer(row["path"]),
+                    }
+                )
+            self.index_keys[_bin] = result
+        return self.index_keys[_bin]
+
+    def _get_search_where(self, conn: sqlite3.Connection, _bin: str) -> SearchWhere:
+        """Get the search criteria builder for a bin."""
+        self._check_cache(conn)
+        if _bin not in self.search_where:
+            search_where = SearchWhere(_bin)
+            search_where.set_keys(self._get_index_keys(conn, _bin))
+            self.search_where[_bin] = search_where
+        return self.search_where[_bin]
+
+    def _forget_bin(self, _bin: str) -> None:
+        """Forget the cached config and index of a bin."""
+        self.bin_cfg.pop(_bin, None)
+        self.index_keys.pop(_bin, None)
+        self.search_where.pop(_bin, None)
+
+    @staticmethod
+    def _index_rows(
+        _bin: str, _id: str, content: Any, keys: Iterable[dict[str, Any]]
+    ) -> list[tuple]:
+        """Index value rows for an item."""
+        rows = []
+        for key in keys:
+            if key["type"] == "in_list":
+                values = key["pointer"].resolve(content, None)
+                if isinstance(values, list):
+                    rows.extend(
+                        (_bin, key["key"], _id, *index_value(v)) for v in values
+                    )
+            else:
+                v = key["pointer"].resolve(content, None)
+                rows.append((_bin, key["key"], _id, *index_value(v)))
+        return rows
 
     def _set_index_item(
         self, conn: sqlite3.Connection, _bin: str, _id: str, content: Any
     ):
         """Set index values for an item in a bin."""
+        # the content is at hand, resolving in python is faster than in sqlite
         self._logger.trace("Setting index for item {} in {}", _id, _bin)
         conn.execute(self._queries["set_index_item_del"], (_bin, _id))
         if content is None:
             return
-        for key in self._get_index_keys(conn, _bin):
-            if key["type"] == "in_list":
-                for v in resolve_pointer(content, key["path"], default=None):
-                    conn.execute(
-                        self._queries["set_index_item_ins"],
-                        (_bin, key["key"], _id, json.dumps(v)),
-                    )
-            else:
-                v = resolve_pointer(content, key["path"], default=None)
-                conn.execute(
-                    self._queries["set_index_item_ins"],
-                    (_bin, key["key"], _id, json.dumps(v)),
-                )
+        rows = self._index_rows(_bin, _id, content, self._get_index_keys(conn, _bin))
+        conn.executemany(self._queries["set_index_item_ins"], rows)
+
+    @staticmethod
+    def _json_object(rows: Iterable[tuple[str, str]]) -> tuple[int, bytes]:
+        """Join (id, json content) rows into a json object, without parsing."""
+        items = [f"{dumps(_id)}:{content}" for _id, content in rows]
+        return len(items), f"{{{','.join(items)}}}".encode()
+
+    @staticmethod
+    def _execute_tuples(
+        conn: sqlite3.Connection, q: str, params: Sequence = ()
+    ) -> sqlite3.Cursor:
+        """Execute a query that returns plain tuples (less overhead on large lists)."""
+        cur = conn.cursor()
+        cur.row_factory = None
+        return cur.execute(q, params)
 
     ### Database connection
+    def _open(self) -> sqlite3.Connection:
+        """Open and configure a database connection."""
+        self._logger.debug("Open database connection")
+        # wait up to 5 seconds for a lock held by another process
+        # writes start with begin immediate, so a read never has to be upgraded
+        # the connection keeps prepared statements by sql text: room for all
+        # fixed queries and plenty of search variations
+        conn = sqlite3.connect(
+            self.path,
+            timeout=5.0,
+            isolation_level="IMMEDIATE",
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        # WAL: readers and the writer do not block each other
+        conn.execute("pragma journal_mode = WAL")
+        conn.execute("pragma synchronous = NORMAL")
+        conn.execute(f"pragma cache_size = {self.cache_size:d}")
+        conn.execute(f"pragma mmap_size = {self.mmap_size:d}")
+        conn.execute("pragma temp_store = MEMORY")
+        conn.execute("pragma foreign_keys = ON")
+        return conn
+
     @contextmanager
     def connect(self) -> Generator[sqlite3.Connection, None, None]:
-        """Open database connection."""
-        with sqlite3.connect(self.path) as conn:
-            conn.row_factory = sqlite3.Row
-            yield conn
+        """Database connection, committed at the end of the outermost block."""
+        # one connection for the lifetime of the object, shared between threads
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._open()
+            # a nested block is part of the transaction of the outer block
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield self._conn
+                finally:
+                    self._depth -= 1
+                return
+            self._depth = 1
+            try:
+                with self._conn:
+                    yield self._conn
+            finally:
+                self._depth = 0
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            if self._conn is not None:
+                self._logger.debug("Close database connection")
+                # keep the query planner statistics up to date
+                self._conn.execute("pragma optimize")
+                self._conn.close()
+                self._conn = None
 
     ### Database version
     def version(self) -> tuple[int, int]:
         """Database version."""
         self._logger.debug("Get database version")
-        if not self.path.exists():
+        if not os.path.exists(self.path):
             return (0, 0)
         with self.connect() as conn:
             try:
@@ -257,14 +451,12 @@ class PakhuisDatabase:
             ]
         return result
 
-    def get_bin_items(self, _bin: str) -> dict[str, Any]:
-        """List of items in a bin."""
+    def get_bin_items_json(self, _bin: str) -> tuple[int, bytes]:
+        """List of items in a bin, as count and serialized json object."""
         self._logger.debug("List of items in {}", _bin)
-        result = {}
         with self.connect() as conn:
-            for row in conn.execute(self._queries["get_bin_items"], (_bin,)):
-                result[row["id"]] = self._get_content(_bin, row)
-        return result
+            q = self._get_content_query(_bin, "get_bin_items")
+            return self._json_object(self._execute_tuples(conn, q, (_bin,)))
 
     def del_bin(self, _bin: str):
         """Remove a bin (no history!)."""
@@ -274,53 +466,102 @@ class PakhuisDatabase:
             conn.execute("""delete from BIN_CONFIG where BIN = ?""", (_bin,))
             conn.execute("""delete from SEARCH_KEYS where BIN = ?""", (_bin,))
             conn.execute("""delete from SEARCH_VALUES where BIN = ?""", (_bin,))
+            self._cache_changed(conn)
+            self._forget_bin(_bin)
 
     ### Bin config
+    def _read_bin_config(self, row: Mapping[str, str] | None) -> dict[str, Any]:
+        """Bin config from a database row (or the defaults)."""
+        if row:
+            result = {k: row[v] for k, (v, _) in self._bin_cfg_keys.items()}
+        else:
+            result = {k: v for k, (_, v) in self._bin_cfg_keys.items()}
+        result["include_id"] = result["include_id"] == "Y"
+        return result
+
     def set_bin_config(self, _bin: str, cfg: dict[str, str]) -> None:
         """Set the config for a bin."""
         self._logger.debug("Set config for {}", _bin)
-        self.bin_cfg.pop(_bin, None)
+        include_id = "Y" if cfg["include_id"] in ("Y", True) else "N"
         with self.connect() as conn:
-            conn.execute(
-                self._queries["set_bin_config"],
-                (_bin, "Y" if cfg["include_id"] in ("Y", True) else "N"),
-            )
+            conn.execute(self._queries["set_bin_config"], (_bin, include_id))
+            self._cache_changed(conn)
 
     def get_bin_config(self, _bin: str) -> dict[str, Any]:
         """Get the config for a bin."""
-        if _bin not in self.bin_cfg:
-            self._logger.debug("Get config for {}", _bin)
-            with self.connect() as conn:
-                row = conn.execute(self._queries["get_bin_config"], (_bin,)).fetchone()
-                if row:
-                    result = {k: row[v] for k, (v, _) in self._bin_cfg_keys.items()}
-                else:
-                    result = {k: v for k, (_, v) in self._bin_cfg_keys.items()}
-            result["include_id"] = result["include_id"] == "Y"
-            self.bin_cfg[_bin] = result
-        return self.bin_cfg[_bin]
+        # the config of all bins is read at once, bins without config use defaults
+        with self.connect() as conn:
+            self._check_cache(conn)
+            if not self._bin_cfg_loaded:
+                self._logger.debug("Get config for all bins")
+                for row in conn.execute(self._queries["get_bin_config"]):
+                    self.bin_cfg[row["bin"]] = self._read_bin_config(row)
+                self._bin_cfg_loaded = True
+        if _bin in self.bin_cfg:
+            return self.bin_cfg[_bin]
+        return self._read_bin_config(None)
 
     ### Items
+    def _insert_item(
+        self,
+        conn: sqlite3.Connection,
+        _bin: str,
+        _id: str,
+        dttm: datetime.datetime,
+        status: str,
+        content: str | None,
+    ) -> bool:
+        """Insert a version of an item, return whether it is the current one."""
+        # only replaces the current version if it is not newer (sync may add history)
+        conn.execute(self._queries["set_item_old"], (_bin, _id, dttm))
+        row = conn.execute(
+            self._queries["set_item"], (_bin, _id, dttm, status, content)
+        ).fetchone()
+        return bool(row[0])
+
     def set_item(
         self, _bin: str, _id: str, content: Any, dttm: datetime.datetime | None = None
-    ) -> None:
-        """Set an item in a bin."""
+    ) -> Any:
+        """Set an item in a bin, return the current content (as get_item)."""
         if dttm is None:
             dttm = datetime.datetime.now(tz=datetime.UTC)
         self._logger.debug("Set item {} in {} with stamp {}", _id, _bin, dttm)
         with self.connect() as conn:
-            conn.execute(
-                self._queries["set_item"], (_bin, _id, dttm, json.dumps(content))
-            )
-            self._set_index_item(conn, _bin, _id, content)
+            if self._insert_item(conn, _bin, _id, dttm, "A", dumps(content)):
+                self._set_index_item(conn, _bin, _id, content)
+                # the stored content is at hand, no need to read it back
+                if self.get_bin_config(_bin)["include_id"] and isinstance(
+                    content, dict
+                ):
+                    return {**content, "id": _id}
+                return content
+        # an older version was added to the history
+        return self.get_item(_bin, _id)
+
+    def set_items(
+        self,
+        _bin: str,
+        items: Iterable[tuple[str, Any, datetime.datetime | None]],
+    ) -> int:
+        """Set several items (id, content, dttm) in a bin in one transaction."""
+        now = datetime.datetime.now(tz=datetime.UTC)
+        self._logger.debug("Set items in {}", _bin)
+        count = 0
+        with self.connect() as conn:
+            for _id, content, dttm in items:
+                if self._insert_item(conn, _bin, _id, dttm or now, "A", dumps(content)):
+                    self._set_index_item(conn, _bin, _id, content)
+                count += 1
+        return count
 
     def get_item(self, _bin: str, _id: str) -> Any:
         """Get an item from a bin."""
         self._logger.debug("Get item {} from {}", _id, _bin)
         with self.connect() as conn:
-            row = conn.execute(self._queries["get_item"], (_bin, _id)).fetchone()
+            q = self._get_content_query(_bin, "get_item")
+            row = conn.execute(q, (_bin, _id)).fetchone()
             if row:
-                return self._get_content(_bin, row)
+                return self._get_content(row)
         return NOTFOUND
 
     def get_item_history(self, _bin: str, _id: str) -> list[dict[str, Any]]:
@@ -328,12 +569,15 @@ class PakhuisDatabase:
         self._logger.debug("Get item {} from {} with history", _id, _bin)
         result = []
         with self.connect() as conn:
-            for row in conn.execute(self._queries["get_item_history"], (_bin, _id)):
+            q = self._get_content_query(_bin, "get_item_history")
+            for row in conn.execute(q, (_bin, _id)):
                 result.append(
                     {
-                        "dttm": row["dttm"],
+                        "dttm": format_dttm(row["dttm"]),
                         "active": row["status"] == "A",
-                        "content": self._get_content(_bin, row),
+                        "content": (
+                            self._get_content(row) if row["status"] == "A" else None
+                        ),
                     }
                 )
         return result or NOTFOUND
@@ -346,8 +590,8 @@ class PakhuisDatabase:
             dttm = datetime.datetime.now(tz=datetime.UTC)
         self._logger.debug("Remove item {} from {} with stamp {}", _id, _bin, dttm)
         with self.connect() as conn:
-            conn.execute(self._queries["set_item"], (_bin, _id, dttm, ""))
-            self._set_index_item(conn, _bin, _id, None)
+            if self._insert_item(conn, _bin, _id, dttm, "I", None):
+                self._set_index_item(conn, _bin, _id, None)
 
     ### Search indexes
     def set_index(self, _bin: str, index: dict[str, str | dict[str, str]]):
@@ -355,16 +599,19 @@ class PakhuisDatabase:
         # single string is the same as {"path": <string>}
         # for the rest, see the SearchWhere class above
         self._logger.debug("New index on {}", _bin)
+        rows = []
+        for k, v in index.items():
+            if isinstance(v, str):
+                v = {"path": v}  # noqa: PLW2901
+            rows.append((_bin, k, v["path"], json_path(v["path"]), v.get("type", "eq")))
+        # new keys and their values in one transaction
         with self.connect() as conn:
             conn.execute(self._queries["set_index_del"], (_bin,))
-            for k, v in index.items():
-                if isinstance(v, str):
-                    v = {"path": v}  # noqa: PLW2901
-                conn.execute(
-                    self._queries["set_index_ins"],
-                    (_bin, k, v["path"], v.get("type", "eq")),
-                )
-        self.refresh_index(_bin)
+            conn.executemany(self._queries["set_index_ins"], rows)
+            self._cache_changed(conn)
+            self.index_keys.pop(_bin, None)
+            self.search_where.pop(_bin, None)
+            self._refresh_index(conn, _bin)
 
     def get_index(self, _bin: str) -> dict[str, dict[str, str]]:
         """Get the index on a bin."""
@@ -381,32 +628,48 @@ class PakhuisDatabase:
         result = []
         with self.connect() as conn:
             for row in conn.execute(self._queries["get_index_values"], (_bin, key)):
-                result.append(json.loads(row[0]))
+                result.append(orjson.loads(row[0]))
         return result
 
+    def _refresh_index(self, conn: sqlite3.Connection, _bin: str) -> None:
+        """Rebuild the index values of a bin."""
+        # one insert per index key, the values are extracted by sqlite
+        conn.execute(self._queries["refresh_index_del"], (_bin,))
+        py_keys = []
+        for key in self._get_index_keys(conn, _bin):
+            if key["json_path"] is None:
+                py_keys.append(key)
+                continue
+            if key["type"] == "in_list":
+                q = self._queries["refresh_index_ins_list"]
+            else:
+                q = self._queries["refresh_index_ins"]
+            conn.execute(q, (_bin, key["key"], key["json_path"]))
+        # keys without an sqlite path are resolved in python, as in set_item
+        if py_keys:
+            rows = []
+            q = self._queries["get_bin_items"]
+            for _id, content in self._execute_tuples(conn, q, (_bin,)):
+                rows.extend(self._index_rows(_bin, _id, orjson.loads(content), py_keys))
+            conn.executemany(self._queries["set_index_item_ins"], rows)
+
     def refresh_index(self, _bin: str):
         """Refresh the index on a bin."""
         self._logger.debug("Refresh index on {}", _bin)
         with self.connect() as conn:
-            for row in conn.execute(self._queries["get_bin_items"], (_bin,)):
-                self._set_index_item(conn, _bin, row["id"], json.loads(row["content"]))
+            self._refresh_index(conn, _bin)
 
     ### Search
-    def search_items(self, _bin: str, search: dict) -> dict[str, Any]:
-        """Search items in a bin (requires an index)."""
+    def search_items_json(self, _bin: str, search: dict) -> tuple[int, bytes]:
+        """Search items in a bin (requires an index), as count and json object."""
         self._logger.debug("Search items from {}", _bin)
-        result = {}
         with self.connect() as conn:
-            self.search_where.set_keys(self._get_index_keys(conn, _bin))
-            where, params = self.search_where.process(search)
+            where, params = self._get_search_where(conn, _bin).process(search)
             params.insert(0, _bin)
-            q = self._queries["search_items"]
+            q = self._get_content_query(_bin, "search_items")
             if where:
                 q = q.replace("1=1", where)
-            for row in conn.execute(q, params):
-                content = self._get_content(_bin, row)
-                result[row["id"]] = content
-        return result
+            return self._json_object(self._execute_tuples(conn, q, params))
 
     ### Sync list
     def sync_list(self, _bin: str = "") -> dict[str, dict[str, dict[str, Any]]]:
@@ -422,11 +685,11 @@ class PakhuisDatabase:
 
         result = {}
         with self.connect() as conn:
-            for row in conn.execute(q, params):
-                bin_obj = result.setdefault(row["bin"], {})
-                bin_obj[row["id"]] = {
-                    "dttm": row["dttm"],
-                    "active": (row["status"] == "A"),
+            for row_bin, row_id, dttm, status in self._execute_tuples(conn, q, params):
+                bin_obj = result.setdefault(row_bin, {})
+                bin_obj[row_id] = {
+                    "dttm": format_dttm(dttm),
+                    "active": (status == "A"),
                 }
         return result
 
@@ -437,12 +700,14 @@ class PakhuisDatabase:
             "Cleanup items in {} before {:%Y-%m-%d}", _bin if _bin else "all", dt
         )
 
+        # one pass: old versions are no longer current, no need to compare dates
         q = self._queries["cleanup"]
+        dttm = datetime.datetime.combine(dt, datetime.time(), datetime.UTC)
         if _bin:
-            q = q.replace("1=1", "P.BIN = ?")
-            params = (_bin, dt)
+            q = q.replace("1=1", "BIN = ?")
+            params = (_bin, dttm)
         else:
-            params = (dt,)
+            params = (dttm,)
 
         result = 0
         with self.connect() as conn:
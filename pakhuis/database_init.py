@@ -2,8 +2,35 @@
 
 # ruff: noqa: E501
 
+import datetime
+import json
 import sqlite3
 
+import orjson
+
+
+def epoch_us(dttm: str | None) -> int:
+    """Convert ISO 8601 date/time (naive is UTC) to microseconds since the epoch."""
+    if not dttm:
+        return 0
+    val = datetime.datetime.fromisoformat(dttm)
+    if val.tzinfo is None:
+        val = val.replace(tzinfo=datetime.UTC)
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+    return (val - epoch) // datetime.timedelta(microseconds=1)
+
+
+def compact_json(text: str) -> str:
+    """Compact json text (as written by orjson), or the text itself if that
+    would change the value (integers over 64 bits, NaN, invalid json)."""
+    try:
+        value = json.loads(text)
+        result = orjson.dumps(value).decode()
+    except (ValueError, TypeError):
+        return text
+    return result if json.loads(result) == value else text
+
+
 def init_db(conn: sqlite3.Connection, version: tuple[int, int]) -> None:
     """Pakhuis database initialization."""
     if version < (1, 0):
@@ -40,3 +67,128 @@ def init_db(conn: sqlite3.Connection, version: tuple[int, int]) -> None:
             commit;
             """
         )
+    if version < (1, 3):
+        # index values are now compact json without ascii escapes (orjson),
+        # convert the existing ones so searches keep matching
+        rows = conn.execute("""select rowid, VALUE from SEARCH_VALUES""").fetchall()
+        conn.executemany(
+            """update SEARCH_VALUES set VALUE = ? where rowid = ?""",
+            [(compact_json(value), rowid) for rowid, value in rows],
+        )
+        conn.execute("""update CONFIG set VERSION = '1.3'""")
+        conn.commit()
+    if version < (1, 4):
+        # flag the current version of each item instead of looking for max(DTTM)
+        # deleted items were stored as an empty active version
+        conn.executescript(
+            """
+            begin;
+            alter table PAKHUIS add column "IS_CURRENT" integer not null default 0;
+            update PAKHUIS set STATUS = 'I', CONTENT = null where CONTENT = '';
+            update PAKHUIS set IS_CURRENT = 1 where rowid in (select rowid from (select rowid, row_number() over (partition by BIN, ID order by DTTM desc, rowid desc) as RN from PAKHUIS) where RN = 1);
+            create index PAKHUIS_CURRENT on PAKHUIS (BIN, ID) where IS_CURRENT = 1;
+            update CONFIG set VERSION = '1.4';
+            commit;
+            """
+        )
+    if version < (1, 5):
+        # indexes for the lookups by bin and id, and for searching
+        # BIN_CONFIG needs a unique bin for insert or replace, keep the last config
+        conn.executescript(
+            """
+            begin;
+            create index PAKHUIS_HISTORY on PAKHUIS (BIN, ID, DTTM);
+            create index SEARCH_KEYS_BIN on SEARCH_KEYS (BIN);
+            create index SEARCH_VALUES_ITEM on SEARCH_VALUES (BIN, ID, KEY, VALUE);
+            create index SEARCH_VALUES_KEY on SEARCH_VALUES (BIN, KEY, VALUE);
+            delete from BIN_CONFIG where rowid not in (select max(rowid) from BIN_CONFIG group by BIN);
+            create unique index BIN_CONFIG_BIN on BIN_CONFIG (BIN);
+            update CONFIG set VERSION = '1.5';
+            commit;
+            analyze;
+            """
+        )
+    if version < (1, 6):
+        # the index is filled by sqlite from the stored json text,
+        # which must be the same compact json (orjson) as the search values
+        rows = conn.execute(
+            """select rowid, CONTENT from PAKHUIS where CONTENT is not null"""
+        ).fetchall()
+        for rowid, content in rows:
+            new_content = compact_json(content)
+            if new_content != content:
+                conn.execute(
+                    """update PAKHUIS set CONTENT = ? where rowid = ?""",
+                    (new_content, rowid),
+                )
+        conn.execute("""update CONFIG set VERSION = '1.6'""")
+        conn.commit()
+    if version < (1, 7):
+        # date/time as integer microseconds: compares correctly across time zones
+        # the current version was flagged by comparing text, flag it again
+        conn.create_function("EPOCH_US", 1, epoch_us, deterministic=True)
+        conn.executescript(
+            """
+            begin;
+            create table PAKHUIS_NEW ("BIN" text, "ID" text, "DTTM" integer not null default (cast((julianday('now') - 2440587.5) * 86400000000 as integer)), "STATUS" text default 'A', "CONTENT" text, "IS_CURRENT" integer not null default 0);
+            insert into PAKHUIS_NEW select BIN, ID, EPOCH_US(DTTM), STATUS, CONTENT, 0 from PAKHUIS order by rowid;
+            update PAKHUIS_NEW set IS_CURRENT = 1 where rowid in (select rowid from (select rowid, row_number() over (partition by BIN, ID order by DTTM desc, rowid desc) as RN from PAKHUIS_NEW) where RN = 1);
+            drop table PAKHUIS;
+            alter table PAKHUIS_NEW rename to PAKHUIS;
+            create index PAKHUIS_CURRENT on PAKHUIS (BIN, ID) where IS_CURRENT = 1;
+            create index PAKHUIS_HISTORY on PAKHUIS (BIN, ID, DTTM);
+            update CONFIG set VERSION = '1.7';
+            commit;
+            analyze;
+            """
+        )
+    if version < (1, 8):
+        # keep the index paths in sqlite json path syntax as well
+        from .database import json_path
+
+        conn.create_function("JSON_PATH", 1, json_path, deterministic=True)
+        conn.executescript(
+            """
+            begin;
+            alter table SEARCH_KEYS add column "JSON_PATH" text;
+            update SEARCH_KEYS set JSON_PATH = JSON_PATH(PATH);
+            update CONFIG set VERSION = '1.8';
+            commit;
+            """
+        )
+    if version < (1, 9):
+        # string values unquoted for glob and like, which can then use an index
+        # (values kept as they were, like NaN, are not valid json for sqlite)
+        conn.executescript(
+            """
+            begin;
+            alter table SEARCH_VALUES add column "TEXT_VALUE" text;
+            update SEARCH_VALUES set TEXT_VALUE = VALUE ->> '$' where iif(json_valid(VALUE), json_type(VALUE), null) = 'text';
+            create index SEARCH_VALUES_TEXT on SEARCH_VALUES (BIN, KEY, TEXT_VALUE);
+            update CONFIG set VERSION = '1.9';
+            commit;
+            """
+        )
+    if version < (1, 10):
+        # like is case insensitive, it can only use an index with nocase collation
+        conn.executescript(
+            """
+            begin;
+            create index SEARCH_VALUES_LIKE on SEARCH_VALUES (BIN, KEY, TEXT_VALUE collate NOCASE);
+            analyze SEARCH_VALUES;
+            update CONFIG set VERSION = '1.10';
+            commit;
+            """
+        )
+    if version < (1, 11):
+        # numbers as numbers for range comparisons, json text sorts "9" after "10"
+        conn.executescript(
+            """
+            begin;
+            alter table SEARCH_VALUES add column "NUM_VALUE" numeric;
+            update SEARCH_VALUES set NUM_VALUE = VALUE ->> '$' where iif(json_valid(VALUE), json_type(VALUE), null) in ('integer', 'real');
+            create index SEARCH_VALUES_NUM on SEARCH_VALUES (BIN, KEY, NUM_VALUE) where NUM_VALUE is not null;
+            update CONFIG set VERSION = '1.11';
+            commit;
+            """
+        )
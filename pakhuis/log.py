@@ -1,5 +1,6 @@
 """Logging with loguru."""
 
+import os
 import sys
 import logging
 from enum import StrEnum
@@ -11,19 +12,35 @@ from loguru import logger
 class InterceptHandler(logging.Handler):
     """Redirect everything to loguru."""
 
+    def __init__(self, level=logging.NOTSET):
+        """Redirect everything to loguru."""
+        super().__init__(level)
+        # bound loggers and level names, so they are not created for every record
+        self._loggers = {}
+        self._levels = {}
+
     def emit(self, record):
         """Emit message."""
         try:
-            level = logger.level(record.levelname).name
-        except ValueError:
-            level = record.levelno
-        frame, depth = logging.currentframe(), 2
-        while frame.f_code.co_filename == logging.__file__:
+            level = self._levels[record.levelname]
+        except KeyError:
+            try:
+                level = logger.level(record.levelname).name
+            except ValueError:
+                level = record.levelno
+            self._levels[record.levelname] = level
+        try:
+            sublogger = self._loggers[record.name]
+        except KeyError:
+            sublogger = self._loggers[record.name] = logger.bind(logtype=record.name)
+        # find the caller outside of the logging module
+        frame, depth = sys._getframe(1), 1
+        while frame and frame.f_code.co_filename == logging.__file__:
             frame = frame.f_back
             depth += 1
-        logger.opt(depth=depth, exception=record.exc_info).bind(
-            logtype=record.name
-        ).log(level, record.getMessage())
+        sublogger.opt(depth=depth, exception=record.exc_info).log(
+            level, record.getMessage()
+        )
 
 
 # log levels as an enum for use with typer
@@ -97,10 +114,18 @@ def init_logger(loglevel: LogLevels, log_dir: Path | None = None, rotation: str
         # rotation and retention is only checked in long-running processes
         # when they reach rotation time.
         # so we do it at startup in case they missed something.
-        logs = list(log_dir.glob(f"{__package__}-*.log"))
+        # scandir entries keep their stat result, no path objects needed
+        prefix = f"{__package__}-"
+        with os.scandir(log_dir) as entries:
+            logs = [
+                e
+                for e in entries
+                if e.name.startswith(prefix) and e.name.endswith(".log")
+            ]
         if len(logs) > retention:
-            for log in sorted(logs, key=lambda p: (-p.stat().st_mtime, p))[retention:]:
-                log.unlink(missing_ok=True)
+            logs.sort(key=lambda e: (-e.stat().st_mtime, e.name))
+            for log in logs[retention:]:
+                Path(log.path).unlink(missing_ok=True)
 
     # debug flag may be useful in the application
     return debug
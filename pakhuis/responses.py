@@ -0,0 +1,20 @@
+"""Pakhuis responses."""
+
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse, Response
+
+
+class ORJSONResponse(JSONResponse):
+    """Json response, serialized with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        """Serialize the content."""
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class RawJSONResponse(Response):
+    """Json response from already serialized bytes."""
+
+    media_type = "application/json"
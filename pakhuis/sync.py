@@ -15,17 +15,26 @@ __version__ = "2.0.1"
 
 import sys
 import getpass
+import itertools
 import tomllib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Annotated, Optional
 
 import httpx
+import orjson
 import typer
 
 from .log import logger, LogLevels, init_logger
 from .tomlconfig import ConfigReader
 
+# request bodies are serialized with orjson, not by httpx
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# number of items per bulk request when copying a whole bin
+BULK_SIZE = 200
+
 
 def raise_for_status(response: httpx.Response):
     """Error for 4xx and 5xx status codes."""
@@ -48,11 +57,24 @@ class ServerConfig:
     name: str = ""
     username: str | None = None
     password: str | None = None
+    auth: httpx.BasicAuth | None = field(default=None, init=False, repr=False)
 
     def __post_init__(self):
         """Post init processing."""
         self.url = self.url.rstrip("/")
 
+    def set_auth(self) -> None:
+        """Prepare the authentication (once, not for every request)."""
+        self.auth = httpx.BasicAuth(self.username, self.password)
+
+    def ask_credentials(self) -> None:
+        """Ask for missing credentials and prepare the authentication."""
+        if not self.username:
+            self.username = input(f"[{self.name}] Username: ")
+        if not self.password:
+            self.password = getpass.getpass(f"[{self.username}@{self.name}] Password: ")
+        self.set_auth()
+
 
 @dataclass
 class SyncConfig:
@@ -71,90 +93,173 @@ class SyncConfig:
 class ServerSync:
     """Sync two pakhuis servers."""
 
-    def __init__(self, cli: httpx.Client) -> None:
-        """Sync two pakhuis servers."""
+    def __init__(self, cli: httpx.Client, workers: int = 8) -> None:
+        """Sync two pakhuis servers.
+
+        workers: number of requests in flight at the same time
+        """
         self.cli = cli
+        self.workers = workers
+
+    def sync_hash(self, server: ServerConfig) -> str | None:
+        """Hash of the sync list of a server (None if not supported)."""
+        result = orjson.loads(
+            self.cli.get(
+                f"{server.url}/_sync",
+                params={"hash": True},
+                auth=server.auth,
+            ).content
+        )
+        # an older server ignores the parameter and sends the sync list itself,
+        # which may well have a bin named "hash"
+        if len(result) == 1 and isinstance(result.get("hash"), str):
+            return result["hash"]
+        return None
 
     def run(self, first: ServerConfig, second: ServerConfig) -> None:
         """Sync two pakhuis servers."""
-        first_content = self.cli.get(
-            f"{first.url}/_sync", auth=(first.username, first.password)
-        ).json()
-        second_content = self.cli.get(
-            f"{second['url']}/_sync", auth=(second["username"], second["password"])
-        ).json()
-
-        first_bins = set(first_content.keys())
-        second_bins = set(second_content.keys())
-
-        # copy missing bins in total
-        for _bin in first_bins - second_bins:
-            self.copy_bin(_bin, first, second)
-        for _bin in second_bins - first_bins:
-            self.copy_bin(_bin, second, first)
-
-        # compare bins
-        for _bin in first_bins & second_bins:
-            first_items = set(first_content[_bin].keys())
-            second_items = set(second_content[_bin].keys())
-
-            # copy missing items in total, skipping inactive items
-            for _id in first_items - second_items:
-                if first_content[_bin][_id]["active"]:
-                    self.copy_item(
-                        _bin, _id, first_content[_bin][_id]["dttm"], first, second
-                    )
-            for _id in second_items - first_items:
-                if second_content[_bin][_id]["active"]:
-                    self.copy_item(
-                        _bin, _id, second_content[_bin][_id]["dttm"], second, first
-                    )
-
-            # compare items
-            for _id in first_items & second_items:
-                first_item = first_content[_bin][_id]
-                second_item = second_content[_bin][_id]
-                # do not sync inactive items
-                if not (first_item["active"] or second_item["active"]):
-                    continue
-
-                # copy last date/time to the other server
-                if first_item["dttm"] > second_item["dttm"]:
+        # nothing to do if both servers have the same active items
+        first_hash = self.sync_hash(first)
+        if first_hash is not None and first_hash == self.sync_hash(second):
+            logger.info("{} and {} are in sync", first.name, second.name)
+            return
+
+        first_content = orjson.loads(
+            self.cli.get(f"{first.url}/_sync", auth=first.auth).content
+        )
+        second_content = orjson.loads(
+            self.cli.get(f"{second.url}/_sync", auth=second.auth).content
+        )
+
+        first_bins = first_content.keys()
+        second_bins = second_content.keys()
+
+        # bins and items are independent, copy them in parallel
+        # (the client is thread safe and the time is spent waiting on the network)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            tasks = []
+
+            # copy missing bins in total
+            for _bin in first_bins - second_bins:
+                tasks.append(pool.submit(self.copy_bin, _bin, first, second))
+            for _bin in second_bins - first_bins:
+                tasks.append(pool.submit(self.copy_bin, _bin, second, first))
+
+            # compare bins
+            for _bin in first_bins & second_bins:
+                first_bin = first_content[_bin]
+                second_bin = second_content[_bin]
+                first_items = first_bin.keys()
+                second_items = second_bin.keys()
+
+                # copy missing items in total, skipping inactive items
+                for _id in first_items - second_items:
+                    first_item = first_bin[_id]
                     if first_item["active"]:
-                        self.copy_item(_bin, _id, first_item["dttm"], first, second)
-                    else:
-                        self.del_item(_bin, _id, second)
-                elif first_item["dttm"] < second_item["dttm"]:
+                        tasks.append(
+                            pool.submit(
+                                self.copy_item,
+                                _bin,
+                                _id,
+                                first_item["dttm"],
+                                first,
+                                second,
+                            )
+                        )
+                for _id in second_items - first_items:
+                    second_item = second_bin[_id]
                     if second_item["active"]:
-                        self.copy_item(_bin, _id, second_item["dttm"], second, first)
-                    else:
-                        self.del_item(_bin, _id, first)
+                        tasks.append(
+                            pool.submit(
+                                self.copy_item,
+                                _bin,
+                                _id,
+                                second_item["dttm"],
+                                second,
+                                first,
+                            )
+                        )
+
+                # compare items
+                for _id in first_items & second_items:
+                    first_item = first_bin[_id]
+                    second_item = second_bin[_id]
+                    first_active = first_item["active"]
+                    second_active = second_item["active"]
+                    # do not sync inactive items
+                    if not (first_active or second_active):
+                        continue
+
+                    # copy last date/time to the other server
+                    first_dttm = first_item["dttm"]
+                    second_dttm = second_item["dttm"]
+                    if first_dttm > second_dttm:
+                        if first_active:
+                            tasks.append(
+                                pool.submit(
+                                    self.copy_item, _bin, _id, first_dttm, first, second
+                                )
+                            )
+                        else:
+                            tasks.append(pool.submit(self.del_item, _bin, _id, second))
+                    elif first_dttm < second_dttm:
+                        if second_active:
+                            tasks.append(
+                                pool.submit(
+                                    self.copy_item,
+                                    _bin,
+                                    _id,
+                                    second_dttm,
+                                    second,
+                                    first,
+                                )
+                            )
+                        else:
+                            tasks.append(pool.submit(self.del_item, _bin, _id, first))
+
+            # raise the first error, if any
+            for task in tasks:
+                task.result()
 
     def copy_bin(self, _bin: str, from_server: ServerConfig, to_server: ServerConfig):
         """Copy a whole bin."""
-        logger.info(f"Copy bin {_bin} from {from_server.name} to {to_server.name}")
-        bin_content = self.cli.get(
-            f"{from_server.url}/{_bin}",
-            params={"full": True, "index": True},
-            auth=(from_server.username, from_server.password),
-        ).json()
-        bin_sync = self.cli.get(
-            f"{from_server.url}/{_bin}/_sync",
-            auth=(from_server.username, from_server.password),
-        ).json()
+        logger.info("Copy bin {} from {} to {}", _bin, from_server.name, to_server.name)
+        bin_content = orjson.loads(
+            self.cli.get(
+                f"{from_server.url}/{_bin}",
+                params={"full": True, "index": True},
+                auth=from_server.auth,
+            ).content
+        )
+        bin_sync = orjson.loads(
+            self.cli.get(
+                f"{from_server.url}/{_bin}/_sync",
+                auth=from_server.auth,
+            ).content
+        )
 
         url = f"{to_server.url}/{_bin}"
-        auth = (to_server.username, to_server.password)
+        auth = to_server.auth
 
         content = bin_content.get("_index")
         if content:
-            self.cli.put(f"{url}/_index", json=content, auth=auth)
-
-        for _id, content in bin_content["items"].items():
             self.cli.put(
-                f"{url}/{_id}",
-                params={"dttm": bin_sync[_bin][_id]["dttm"]},
-                json=content,
+                f"{url}/_index",
+                content=orjson.dumps(content),
+                headers=JSON_HEADERS,
+                auth=auth,
+            )
+
+        # items in chunks, to keep request bodies and server transactions small
+        items = (
+            {"id": _id, "dttm": bin_sync[_bin][_id]["dttm"], "content": content}
+            for _id, content in bin_content["items"].items()
+        )
+        for chunk in itertools.batched(items, BULK_SIZE):
+            self.cli.post(
+                f"{url}/_bulk",
+                content=orjson.dumps(chunk),
+                headers=JSON_HEADERS,
                 auth=auth,
             )
 
@@ -168,25 +273,25 @@ class ServerSync:
     ):
         """Copy an item in a bin."""
         logger.info(
-            f"Copy item {_bin}/{_id} from {from_server.name} to {to_server.name}"
+            "Copy item {}/{} from {} to {}", _bin, _id, from_server.name, to_server.name
         )
+        # pass the json on as-is, no need to parse it
         content = self.cli.get(
             f"{from_server.url}/{_bin}/{_id}",
-            auth=(from_server.username, from_server.password),
-        ).json()
+            auth=from_server.auth,
+        ).content
         self.cli.put(
             f"{to_server.url}/{_bin}/{_id}",
             params={"dttm": dttm},
-            json=content,
-            auth=(to_server.username, to_server.password),
+            content=content,
+            headers=JSON_HEADERS,
+            auth=to_server.auth,
         )
 
     def del_item(self, _bin: str, _id: str, server: ServerConfig):
         """Delete an item."""
-        logger.info(f"Delete item {_bin}/{_id} from {server.name}")
-        self.cli.delete(
-            f"{server.url}/{_bin}/{_id}", auth=(server.username, server.password)
-        )
+        logger.info("Delete item {}/{} from {}", _bin, _id, server.name)
+        self.cli.delete(f"{server.url}/{_bin}/{_id}", auth=server.auth)
 
 
 def main(
@@ -209,6 +314,9 @@ def main(
             "-2", "--second", help="Server 2 (as defined in config)", show_default=False
         ),
     ] = None,
+    workers: Annotated[
+        int, typer.Option(min=1, help="Number of parallel requests")
+    ] = 8,
     loglevel: LogLevels = "info",
 ):
     """Pakhuis sync.
@@ -223,40 +331,34 @@ def main(
 
         ### config file
         cfg = ConfigReader.from_file(SyncConfig, cfg_file)
-        for k, v in cfg.servers:
+        for k, v in cfg.servers.items():
             if not v.name:
                 v.name = k
 
         first = cfg.servers[server1 or cfg.default1]
-        if not first.username:
-            first.username = input(f"[{first.name}] Username: ")
-        if not first.password:
-            first.password = getpass.getpass(
-                f"[{first.username}@{first.name}] Password: "
-            )
+        first.ask_credentials()
 
         with httpx.Client(
             verify=False,
             follow_redirects=True,
             event_hooks={"response": [raise_for_status]},
+            # a kept-alive connection for every worker
+            limits=httpx.Limits(
+                max_connections=workers, max_keepalive_connections=workers
+            ),
         ) as cli:
             if cleanup:
                 cli.get(
                     f"{first.url}/_cleanup",
                     params={"days": 180},
-                    auth=(first.username, first.password),
+                    auth=first.auth,
                 )
 
             else:
                 second = cfg.servers[server2 or cfg.default2]
-                if not second.username:
-                    second.username = input(f"[{second.name}] Username: ")
-                if not second.password:
-                    second.password = getpass.getpass(
-                        f"[{second.username}@{second.name}] Password: "
-                    )
-
-                ServerSync(cli).run(first, second)
+                second.ask_credentials()
+
+                ServerSync(cli, workers).run(first, second)
 
         logger.success("Complete")
 
@@ -6,6 +6,7 @@ __author__ = "Rogier Steehouder <rogiersteehouder@gmail.com>"
 __date__ = "2024-05-26"
 __version__ = "1.2"
 
+import functools
 import tomllib
 from collections.abc import Callable
 from dataclasses import is_dataclass, fields
@@ -18,6 +19,14 @@ class ConfigError(Exception):
     """Configuration Error."""
 
 
+@functools.lru_cache(maxsize=8)
+def _read_toml(path: Path, mtime_ns: int) -> dict:
+    """Read toml file (cached by path and modification time)."""
+    # the result is shared between callers, so it must not be modified
+    with path.open("rb") as f:
+        return tomllib.load(f)
+
+
 class ConfigReader:
     """Read configuration from toml file(s)."""
 
@@ -32,7 +41,7 @@ class ConfigReader:
     @staticmethod
     def read_data_from_file(cfg_file: Path) -> dict:
         """Read data from toml file."""
-        return tomllib.loads(cfg_file.read_text(encoding="utf-8"))
+        return _read_toml(cfg_file.resolve(), cfg_file.stat().st_mtime_ns)
 
     @classmethod
     def from_file[
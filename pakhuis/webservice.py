@@ -1,38 +1,87 @@
 """Pakhuis webservice."""
 
 import datetime
+import hashlib
 import uuid
 from pathlib import Path
+from typing import Any
 
 import jsonpatch
+import orjson
 from starlette import status
 from starlette.exceptions import HTTPException
+from starlette.datastructures import QueryParams
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import Response
 from starlette.routing import Route
 
 from . import __version__, database
 from .log import logger
+from .responses import ORJSONResponse, RawJSONResponse
+
+
+def parse_dttm(val: str) -> datetime.datetime | None:
+    """Date/time parameter (iso format), empty is none."""
+    return datetime.datetime.fromisoformat(val) if val else None
+
+
+def bulk_item_id(item: dict) -> str:
+    """Item id in a bulk request, generated if missing."""
+    _id = item.get("id")
+    if _id is None:
+        return str(uuid.uuid4())
+    if not isinstance(_id, str) or not _id:
+        raise ValueError(f"id must be a non-empty string, not {_id!r}")
+    return _id
+
+
+def list_response(count: int, items: bytes, index: dict | None = None) -> Response:
+    """List response from items that are already serialized."""
+    body = b'{"count":%d,"items":%s' % (count, items)
+    if index:
+        body += b',"_index":' + orjson.dumps(index)
+    return RawJSONResponse(body + b"}", status_code=status.HTTP_200_OK)
 
 
 class Params:
     """Common parameters and easy access to uncommon ones."""
 
+    __slots__ = ("request", "bin", "id", "get", "post", "put", "patch", "delete")
+
     def __init__(self, request: Request):
         """Common parameters and easy access to uncommon ones."""
-        self.bin = request.path_params.get("_bin", "")
-        self.id = request.path_params.get("_id", "")
-        self.query_params = request.query_params
-
-        self.user = request.headers.get("Caddy-Auth-User")
+        self.request = request
+        path_params = request.path_params
+        self.bin = path_params.get("_bin", "")
+        self.id = path_params.get("_id", "")
+
+        method = request.method
+        self.get = method == "GET"
+        self.post = method == "POST"
+        self.put = method == "PUT"
+        self.patch = method == "PATCH"
+        self.delete = method == "DELETE"
+
+    # query string and headers are parsed by starlette on first use
+    @property
+    def query_params(self) -> QueryParams:
+        """Query parameters."""
+        return self.request.query_params
 
-        self.get = request.method == "GET"
-        self.post = request.method == "POST"
-        self.put = request.method == "PUT"
-        self.patch = request.method == "PATCH"
-        self.delete = request.method == "DELETE"
+    @property
+    def user(self) -> str | None:
+        """Authenticated user (from the reverse proxy)."""
+        return self.request.headers.get("Caddy-Auth-User")
 
-        self.json = request.json
+    async def json(self) -> Any:
+        """Request body as json."""
+        # parse the body bytes directly, without decoding to str first
+        try:
+            return orjson.loads(await self.request.body())
+        except orjson.JSONDecodeError as exc:
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST, f"Invalid json: {exc}"
+            ) from exc
 
     def q(self, key: str, default: str = "") -> str:
         """Query parameters."""
@@ -42,11 +91,17 @@ class Params:
 class PakhuisService:
     """Pakhuis Webservice."""
 
-    def __init__(self, database_path: Path) -> None:
-        """Pakhuis Webservice."""
+    def __init__(self, database_path: str | Path, **db_options: Any) -> None:
+        """Pakhuis Webservice.
+
+        db_options: passed on to the database (see PakhuisDatabase)
+        """
         self._logger = logger.bind(logtype="pakhuis.webservice")
-        self.db = database.PakhuisDatabase(database_path)
-        self.routes = [
+        self.db = database.PakhuisDatabase(database_path, **db_options)
+        # the database is upgraded on open, its version is fixed from here on
+        self.db_version = "{}.{}".format(*self.db.version())
+        # route table is fixed, starlette compiles the path regexes once
+        self.routes = (
             Route("/", self.root, methods=["GET"]),
             Route("/_ping", self.ping, methods=["GET", "HEAD"]),
             Route("/_cleanup", self.cleanup, methods=["GET"]),
@@ -55,6 +110,7 @@ class PakhuisService:
             Route("/{_bin}", self.delete_bin, methods=["DELETE"]),
             Route("/{_bin}", self.doc, methods=["POST"]),
             Route("/{_bin}/_cleanup", self.cleanup, methods=["GET"]),
+            Route("/{_bin}/_bulk", self.bulk, methods=["POST"]),
             Route("/{_bin}/_config", self.bin_config, methods=["GET", "PUT"]),
             Route("/{_bin}/_index", self.bin_index, methods=["GET", "PUT"]),
             Route("/{_bin}/_index/values", self.bin_index_values, methods=["GET"]),
@@ -63,17 +119,16 @@ class PakhuisService:
             Route("/{_bin}/{_id}", self.doc, methods=["GET", "PUT", "PATCH"]),
             Route("/{_bin}/{_id}", self.delete_doc, methods=["DELETE"]),
             Route("/{_bin}/{_id}/_history", self.doc_history, methods=["GET"]),
-        ]
+        )
 
     async def ping(self, request: Request):
         """Ping: show that the service works and return version info."""
         p = Params(request)
-        v = "{}.{}".format(*self.db.version())
-        return JSONResponse(
+        return ORJSONResponse(
             {
                 "app": "Pakhuis",
                 "version": __version__,
-                "db": v,
+                "db": self.db_version,
                 "user": p.user,
             },
             status_code=status.HTTP_200_OK,
@@ -82,7 +137,7 @@ class PakhuisService:
     async def root(self, request: Request):
         """Root: list of bins."""
         items = self.db.get_bins()
-        return JSONResponse(
+        return ORJSONResponse(
             {"count": len(items), "items": items}, status_code=status.HTTP_200_OK
         )
 
@@ -95,18 +150,18 @@ class PakhuisService:
         """
         p = Params(request)
 
-        items = (
-            self.db.get_bin_items(p.bin)
-            if p.q("full")
-            else self.db.get_bin_item_ids(p.bin)
-        )
         index = self.db.get_index(p.bin) if p.q("index") else None
+        if p.q("full"):
+            # stored content is already json, pass it on without parsing
+            count, items = self.db.get_bin_items_json(p.bin)
+            return list_response(count, items, index)
 
+        items = self.db.get_bin_item_ids(p.bin)
         result = {"count": len(items), "items": items}
         if index:
             result["_index"] = index
 
-        return JSONResponse(result, status_code=status.HTTP_200_OK)
+        return ORJSONResponse(result, status_code=status.HTTP_200_OK)
 
     async def bin_config(self, request: Request):
         """Get or set the bin config."""
@@ -117,7 +172,7 @@ class PakhuisService:
             self.db.set_bin_config(p.bin, cfg)
             code = status.HTTP_201_CREATED
         result = self.db.get_bin_config(p.bin)
-        return JSONResponse(result, status_code=code)
+        return ORJSONResponse(result, status_code=code)
 
     async def bin_index(self, request: Request):
         """Get or set the bin index definition."""
@@ -128,22 +183,20 @@ class PakhuisService:
             self.db.set_index(p.bin, index)
             code = status.HTTP_201_CREATED
         result = self.db.get_index(p.bin)
-        return JSONResponse(result, status_code=code)
+        return ORJSONResponse(result, status_code=code)
 
     async def bin_index_values(self, request: Request):
         """Get index values for a given index key (useful for select lists)."""
         p = Params(request)
         key = p.q("key")
         result = self.db.get_index_values(p.bin, key)
-        return JSONResponse(result, status_code=status.HTTP_200_OK)
+        return ORJSONResponse(result, status_code=status.HTTP_200_OK)
 
     async def bin_search(self, request: Request):
         """Search a bin with a search object."""
         p = Params(request)
         if p.get:
-            srch = {}
-            for k, v in p.query_params.items():
-                srch[k] = v
+            srch = dict(p.query_params)
         elif p.post:
             srch = await p.json()
 
@@ -151,15 +204,13 @@ class PakhuisService:
             raise HTTPException(status.HTTP_404_NOT_FOUND, "Empty search")
 
         try:
-            items = self.db.search_items(p.bin, srch)
+            count, items = self.db.search_items_json(p.bin, srch)
         except KeyError as exc:
             raise HTTPException(
                 status.HTTP_400_BAD_REQUEST, f"Not a search key: {exc.args[0]}"
             ) from exc
 
-        return JSONResponse(
-            {"count": len(items), "items": items}, status_code=status.HTTP_200_OK
-        )
+        return list_response(count, items)
 
     async def doc(self, request: Request):
         """Get, set or patch a json document.
@@ -168,9 +219,7 @@ class PakhuisService:
             dttm: date/time of the document (iso format)
         """
         p = Params(request)
-        dttm = p.q("dttm")
-        if dttm:
-            dttm = datetime.datetime.fromisoformat(dttm)
+        dttm = parse_dttm(p.q("dttm"))
         code = status.HTTP_200_OK
 
         # add or overwrite
@@ -178,7 +227,7 @@ class PakhuisService:
             if not p.id:
                 p.id = str(uuid.uuid4())
             content = await p.json()
-            self.db.set_item(p.bin, p.id, content, dttm)
+            result = self.db.set_item(p.bin, p.id, content, dttm)
             code = status.HTTP_201_CREATED
 
         # patch existing
@@ -190,11 +239,17 @@ class PakhuisService:
                     status.HTTP_404_NOT_FOUND,
                     f"Item {p.id} not found in {p.bin}",
                 )
-            jsonpatch.apply_patch(content, patch, in_place=True)
-            self.db.set_item(p.bin, p.id, content)
+            if patch:
+                jsonpatch.apply_patch(content, patch, in_place=True)
+                result = self.db.set_item(p.bin, p.id, content)
+            else:
+                # nothing to change, don't store a new version
+                result = content
 
         # show
-        result = self.db.get_item(p.bin, p.id)
+        else:
+            result = self.db.get_item(p.bin, p.id)
+
         if (p.put or p.post) and result is database.NOTFOUND:
             raise HTTPException(
                 status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -207,7 +262,30 @@ class PakhuisService:
 
         if p.put or p.post:
             result = {"id": p.id, "content": result}
-        return JSONResponse(result, status_code=code)
+        return ORJSONResponse(result, status_code=code)
+
+    async def bulk(self, request: Request):
+        """Set several json documents at once.
+
+        body: list of {"id": ..., "content": ..., "dttm": ...} (id and dttm optional)
+        """
+        p = Params(request)
+        body = await p.json()
+        try:
+            items = [
+                (
+                    bulk_item_id(item),
+                    item["content"],
+                    parse_dttm(item.get("dttm")),
+                )
+                for item in body
+            ]
+        except (AttributeError, KeyError, TypeError, ValueError) as exc:
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST, f"Invalid item list: {exc}"
+            ) from exc
+        count = self.db.set_items(p.bin, items)
+        return ORJSONResponse({"count": count}, status_code=status.HTTP_201_CREATED)
 
     async def delete_doc(self, request: Request):
         """Delete a json document (mark as inactive in history)."""
@@ -234,12 +312,28 @@ class PakhuisService:
             raise HTTPException(
                 status.HTTP_404_NOT_FOUND, f"Item {p.id} not found in {p.bin}"
             )
-        return JSONResponse(result, status_code=status.HTTP_200_OK)
+        return ORJSONResponse(result, status_code=status.HTTP_200_OK)
 
     async def sync_list(self, request: Request):
-        """Sync list."""
+        """Sync list.
+
+        query parameters:
+            hash: only a hash of the active items (to see if a sync has work to do)
+        """
         p = Params(request)
-        return JSONResponse(self.db.sync_list(p.bin), status_code=status.HTTP_200_OK)
+        result = self.db.sync_list(p.bin)
+        if p.q("hash"):
+            # only what a sync acts on: active items and their date/time
+            # (synced deletes and cleanup leave different inactive items behind)
+            active = {}
+            for _bin, items in result.items():
+                dttms = {k: v["dttm"] for k, v in items.items() if v["active"]}
+                if dttms:
+                    active[_bin] = dttms
+            # the sync list is ordered, equal lists give equal hashes
+            digest = hashlib.blake2b(orjson.dumps(active), digest_size=16)
+            result = {"hash": digest.hexdigest()}
+        return ORJSONResponse(result, status_code=status.HTTP_200_OK)
 
     async def cleanup(self, request: Request):
         """Cleanup.
@@ -250,10 +344,10 @@ class PakhuisService:
         """
         p = Params(request)
         if "dt" in p.query_params:
-            dt = datetime.date.fromisofromat(p.q("dt"))
+            dt = datetime.date.fromisoformat(p.q("dt"))
         elif "days" in p.query_params:
             dt = datetime.date.today() - datetime.timedelta(days=int(p.q("days")))
         else:
             raise HTTPException(status.HTTP_400_BAD_REQUEST, "Date parameter missing")
         count = self.db.cleanup(p.bin, dt=dt)
-        return JSONResponse({"count": count}, status_code=status.HTTP_200_OK)
+        return ORJSONResponse({"count": count}, status_code=status.HTTP_200_OK)